@@ -0,0 +1,126 @@
+import argparse
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from src.game import game_dictionary
+from src.learning_rule import learning_rule_dictionary
+from src.main import objects_setup
+from src.unified_learning import UnifiedLearning
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Allocation and speed benchmark of the plain, buffered and event-driven runs")
+
+    parser.add_argument("--iterations", type=int, default=2000, help="Measured iterations")
+    parser.add_argument("--warmup", type=int, default=100, help="Iterations run before measuring")
+    parser.add_argument("--event-driven", action="store_true",
+                        help="Compare the time of whole plain and event-driven runs of --iterations iterations instead")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of each timed event-driven comparison run")
+    parser.add_argument("--game", type=str, default="treasure", choices=list(game_dictionary),
+                        help="Game to play: treasure or staghunt")
+    parser.add_argument("--learning-rule", type=str, default="loglinear", choices=list(learning_rule_dictionary),
+                        help="Learning rule: loglinear or mardenmood")
+    parser.add_argument("--rule-coeffs", type=float, nargs="+", default=[0.01],
+                        help="Coefficients for the learning rule ([eps] for LogLinear, [eps,c] for MardenMood)")
+
+    return parser.parse_args()
+
+
+def plain_iteration(learner):
+    """ Prepares a learner for the plain run and returns its single iteration (same body as UnifiedLearning.run). """
+    learner._initialize()
+
+    def iteration(t):
+        learner.V_history.append(learner.V[0, 1, 0])
+        learner._step(t)
+        learner.s1_action_history.append(learner.a[1][0])
+
+    return iteration
+
+
+def buffered_iteration(learner):
+    """ Prepares a learner for the buffered run and returns its single iteration. """
+    learner._initialize()
+    learner._load_buffers()
+    return learner._buffered_step
+
+
+def measure(iteration, warmup, iterations):
+    """
+    Runs the iterations after warmup ones, counting the memory blocks each of them leaves allocated
+    (sys.getallocatedblocks after minus before the iteration). The transient memory, allocated and released within
+    an iteration (e.g. loop iterators), is measured separately with tracemalloc as its peak in bytes.
+
+    Returns:
+        dict: fraction of iterations that retain blocks, mean retained blocks and peak transient bytes per iteration,
+        time per iteration.
+    """
+    for t in range(warmup):
+        iteration(t)
+
+    start = time.perf_counter()
+    for t in range(warmup, warmup + iterations):
+        iteration(t)
+    elapsed = time.perf_counter() - start
+
+    retained = []
+    for t in range(warmup + iterations, warmup + 2 * iterations):
+        before = sys.getallocatedblocks()
+        iteration(t)
+        retained.append(sys.getallocatedblocks() - before)
+
+    peaks = []
+    tracemalloc.start()
+    for t in range(warmup + 2 * iterations, warmup + 3 * iterations):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        iteration(t)
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+
+    return {
+        "allocating": sum(blocks != 0 for blocks in retained) / iterations,
+        "retained_blocks": sum(retained) / iterations,
+        "peak_bytes": sum(peaks) / iterations,
+        "us_per_iter": elapsed / iterations * 1e6,
+    }
+
+
+def time_run(game, learning_rule, T, seed, **run_options):
+    """ Times a whole run of T iterations. Returns the seconds taken and the final V of state 0 at stage 1. """
+    np.random.seed(seed)
+    learner = UnifiedLearning(game=game, T=T, learning_rule=learning_rule, **run_options)
+    start = time.perf_counter()
+    learner.run()
+    return time.perf_counter() - start, learner.V[:, 1, 0]
+
+
+def main():
+    args = parse_args()
+    game, learning_rule = objects_setup(args)
+
+    if args.event_driven:
+        print(f"{'run':<14}{'seconds':>10}{'us/iter':>10}{'speedup':>10}   final V[1, 0]")
+        plain_seconds = None
+        for name, run_options in [("plain", {}), ("event-driven", {"event_driven": True})]:
+            seconds, V = time_run(game, learning_rule, args.iterations, args.seed, **run_options)
+            plain_seconds = plain_seconds or seconds
+            print(f"{name:<14}{seconds:>10.2f}{seconds / args.iterations * 1e6:>10.1f}"
+                  f"{plain_seconds / seconds:>9.1f}x   {np.round(V, 4)}")
+        return
+
+    T = args.warmup + 3 * args.iterations
+
+    print(f"{'run':<10}{'allocating iters':>18}{'retained blocks/iter':>22}{'transient peak B/iter':>23}{'us/iter':>10}")
+    for name, prepare in [("plain", plain_iteration), ("buffered", buffered_iteration)]:
+        learner = UnifiedLearning(game=game, T=T, learning_rule=learning_rule)
+        stats = measure(prepare(learner), args.warmup, args.iterations)
+        print(f"{name:<10}{stats['allocating']:>17.1%}{stats['retained_blocks']:>22.2f}"
+              f"{stats['peak_bytes']:>23.1f}{stats['us_per_iter']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,10 +2,39 @@ import numpy as np
 from abc import ABC, abstractmethod
 
 
+class UniformStream:
+    """
+    Uniform samples in [0,1) drawn from np.random in blocks, so that taking a single one doesn't allocate.
+    The block size is kept within the cached small integers of python for the same reason.
+    """
+    def __init__(self, block_size=256):
+        self.block_size = block_size
+        self.reset()
+
+    def reset(self):
+        """ Discards the samples already drawn, e.g. after seeding np.random. """
+        self._block = None
+        self._pos = self.block_size
+
+    def next(self):
+        if self._pos == self.block_size:
+            self._block = np.random.random(self.block_size)
+            self._pos = 0
+        u = self._block.item(self._pos)
+        self._pos += 1
+        return u
+
+    def randint(self, n):
+        """ Uniform integer in [0, n). """
+        return int(self.next() * n)
+
+
 class LearningRule(ABC):
     """
     Base class for a learning rule, determines the framework that actual learning rules have to follow.
     """
+    hidden_values = [0.0]   # possible hidden vars, the buffered run stores them as indices in this list
+
     @abstractmethod
     def update_vars(self,current_action, current_hidden, num_players, actions, q_vals):
         """
@@ -23,6 +52,46 @@ class LearningRule(ABC):
         """
         pass
 
+    def update_vars_into(self, current_action, current_hidden, num_players, actions, q_vals, new_action, new_hidden, uniforms):
+        """
+        Same as update_vars, but reads and writes np.array buffers, with hidden vars coded as indices of hidden_values.
+        Used by the buffered run: rules override it with a kernel that doesn't allocate, this default wraps update_vars.
+
+        Args:
+            current_action, current_hidden (np.array): current joint action and hidden vars codes (read only).
+            new_action, new_hidden (np.array): output buffers for the new joint action and hidden vars codes.
+            uniforms (UniformStream): source of the random numbers.
+        """
+        hidden = [self.hidden_values[code] for code in current_hidden]
+        action, hidden = self.update_vars(list(current_action), hidden, num_players, actions, q_vals)
+        new_action[:] = action
+        new_hidden[:] = [self.hidden_values.index(x) for x in hidden]
+
+    def hold_probability(self, current_action, current_hidden, num_players, actions, q_vals, q_upper=None):
+        """
+        Probability that update_vars leaves both the joint action and the hidden vars unchanged.
+        Used by the event-driven simulation to skip the iterations in which nothing happens.
+
+        Args:
+            q_vals (np.array): Q-values for the possible actions of the agents.
+            q_upper (np.array): if given, q_vals and q_upper are the lower and upper bounds of each Q-value
+                                and the returned value is a lower bound of the probability over that range.
+
+        Returns:
+            float or None: the probability, None if the rule cannot compute it for the current variables.
+        """
+        return None
+
+    def sample_change(self, current_action, current_hidden, num_players, actions, q_vals):
+        """
+        Samples update_vars conditioned on the joint action or the hidden vars being changed.
+        Only called when hold_probability returned a value smaller than 1.
+
+        Returns:
+            list, list: new action and new auxiliary variable.
+        """
+        raise NotImplementedError
+
 
 class LogLinearRule(LearningRule):
     """
@@ -39,13 +108,7 @@ class LogLinearRule(LearningRule):
     def update_vars(self, current_action, current_hidden, num_players, actions, q_vals):
         player_to_update = np.random.randint(num_players)
 
-        if (player_to_update == 0):
-            q_values_for_player = np.array(q_vals[player_to_update,:,current_action[1]])
-        else:
-            q_values_for_player = np.array(q_vals[player_to_update,current_action[0],:])
-
-        unnorm_probs = pow(self.epsilon, -q_values_for_player)
-        new_action_probs = unnorm_probs / (unnorm_probs.sum())
+        new_action_probs = self._action_probs(q_vals, player_to_update, current_action)
         
         new_action_for_player = np.random.choice(actions, p=new_action_probs)
         
@@ -53,6 +116,80 @@ class LogLinearRule(LearningRule):
         new_joint_action[player_to_update] = new_action_for_player
         
         return new_joint_action, current_hidden
+
+    def update_vars_into(self, current_action, current_hidden, num_players, actions, q_vals, new_action, new_hidden, uniforms):
+        player_to_update = uniforms.randint(num_players)
+        a1, a2 = current_action.item(0), current_action.item(1)
+
+        # inverse CDF sampling of the softmax, without building the probability vector
+        total = 0.0
+        for b in range(len(actions)):
+            total += self._unnorm_prob(q_vals, player_to_update, b, a1, a2)
+        threshold = uniforms.next() * total
+
+        new_action_idx = 0
+        cumulative = self._unnorm_prob(q_vals, player_to_update, 0, a1, a2)
+        while cumulative <= threshold and new_action_idx < len(actions) - 1:
+            new_action_idx += 1
+            cumulative += self._unnorm_prob(q_vals, player_to_update, new_action_idx, a1, a2)
+
+        for i in range(num_players):
+            new_action[i] = current_action.item(i)
+            new_hidden[i] = current_hidden.item(i)
+        new_action[player_to_update] = actions[new_action_idx]
+
+    def hold_probability(self, current_action, current_hidden, num_players, actions, q_vals, q_upper=None):
+        # the selected player keeps its action: worst case is its current action at the lower bound, the others at the upper one
+        if q_upper is None:
+            q_upper = q_vals
+        a1, a2 = int(current_action[0]), int(current_action[1])
+        hold = 0.0
+        for i in range(num_players):
+            current = int(current_action[i])
+            unnorm_current = self._unnorm_prob(q_vals, i, current, a1, a2)
+            total = unnorm_current
+            for b in range(len(actions)):
+                if b != current:
+                    total += self._unnorm_prob(q_upper, i, b, a1, a2)
+            hold += unnorm_current / total / num_players
+        return hold
+
+    def sample_change(self, current_action, current_hidden, num_players, actions, q_vals):
+        # joint probability of (player, new action), restricted to the actions different from the current one
+        a1, a2 = int(current_action[0]), int(current_action[1])
+        weights = []
+        for i in range(num_players):
+            unnorm = [self._unnorm_prob(q_vals, i, b, a1, a2) for b in range(len(actions))]
+            total = sum(unnorm)
+            weights += [(i, b, unnorm[b] / total) for b in range(len(actions)) if b != int(current_action[i])]
+
+        threshold = np.random.random() * sum(weight for _, _, weight in weights)
+        for player_to_update, new_action_idx, weight in weights:
+            threshold -= weight
+            if threshold < 0:
+                break
+
+        new_joint_action = list(current_action)
+        new_joint_action[player_to_update] = actions[new_action_idx]
+
+        return new_joint_action, current_hidden
+
+    def _q_values_for_player(self, q_vals, player, current_action):
+        """ Q-values of the player for each of its actions, keeping fixed the action of the other player (in double precision). """
+        if (player == 0):
+            return np.array(q_vals[player,:,current_action[1]], dtype=np.float64)
+        return np.array(q_vals[player,current_action[0],:], dtype=np.float64)
+
+    def _unnorm_prob(self, q_vals, player, action, a1, a2):
+        """ Unnormalised probability of the player choosing action, the other player keeping its action. """
+        if (player == 0):
+            return pow(self.epsilon, -q_vals.item(player, action, a2))
+        return pow(self.epsilon, -q_vals.item(player, a1, action))
+
+    def _action_probs(self, q_vals, player, current_action):
+        q_values_for_player = self._q_values_for_player(q_vals, player, current_action)
+        unnorm_probs = pow(self.epsilon, -q_values_for_player)
+        return unnorm_probs / (unnorm_probs.sum())
     
     
 class MardenMoodRule(LearningRule):
@@ -61,6 +198,8 @@ class MardenMoodRule(LearningRule):
     The hidden variables represent the internal mood of each agent: C (content) or D (discontent).
     Parameters: epsilon in (0,1), c >= num_players.
     """
+    DISCONTENT, CONTENT = 0, 1
+    hidden_values = ['D', 'C']      # indexed by the mood codes
 
     def __init__(self, epsilon, c, reward_prec:int=2):
         # self.beta = beta
@@ -90,7 +229,70 @@ class MardenMoodRule(LearningRule):
                 else:
                     new_action[i] = current_action[i]
         
+        new_hidden = self._update_moods(current_action, current_hidden, new_action, num_players, q_vals)
+
+        return new_action, new_hidden
+
+    def update_vars_into(self, current_action, current_hidden, num_players, actions, q_vals, new_action, new_hidden, uniforms):
+        prob_explore = pow(self.epsilon, self.c)
+        num_actions = len(actions)
+
+        #Action update
+        action_changed = False
+        for i in range(num_players):
+            action_i = current_action.item(i)
+            if current_hidden.item(i) == self.DISCONTENT:          # discontent -> chooses randomly
+                new_action_i = actions[uniforms.randint(num_actions)]
+            elif num_actions > 1 and uniforms.next() < prob_explore:
+                other_idx = uniforms.randint(num_actions - 1)     # uniform among the actions different from the current
+                new_action_i = actions[other_idx] if other_idx < action_i else actions[other_idx + 1]
+            else:
+                new_action_i = action_i
+            new_action[i] = new_action_i
+            action_changed = action_changed or (new_action_i != action_i)
+
         #Mood update
+        a1, a2 = new_action.item(0), new_action.item(1)
+        for i in range(num_players):
+            if (current_hidden.item(i) == self.CONTENT) and not action_changed:
+                new_hidden[i] = self.CONTENT
+            elif uniforms.next() < pow(self.epsilon, 1 - q_vals.item(i, a1, a2)):
+                new_hidden[i] = self.CONTENT
+            else:
+                new_hidden[i] = self.DISCONTENT
+
+    def hold_probability(self, current_action, current_hidden, num_players, actions, q_vals, q_upper=None):
+        # with a discontent agent the outcome depends on Q: no closed form, the step is simulated
+        if any(hidden != 'C' for hidden in current_hidden):
+            return None
+        if len(actions) < 2:
+            return 1.0
+        return pow(1 - pow(self.epsilon, self.c), num_players)
+
+    def sample_change(self, current_action, current_hidden, num_players, actions, q_vals):
+        # all agents are content: at least one of them explores
+        prob_explore = pow(self.epsilon, self.c)
+        new_action = current_action[:]
+        explored = False
+
+        for i in range(num_players):
+            if explored:
+                explore = np.random.rand() < prob_explore
+            else:
+                # no agent explored so far: condition on at least one of the remaining ones exploring
+                explore = np.random.rand() * (1 - pow(1 - prob_explore, num_players - i)) < prob_explore
+
+            if explore:
+                other_actions = [a for a in actions if a != current_action[i]]
+                new_action[i] = np.random.choice(other_actions)
+                explored = True
+
+        new_hidden = self._update_moods(current_action, current_hidden, new_action, num_players, q_vals)
+
+        return new_action, new_hidden
+
+    def _update_moods(self, current_action, current_hidden, new_action, num_players, q_vals):
+        """ Mood update, given the old and the new joint actions. """
         new_hidden = np.copy(current_hidden)
 
         for i in range(num_players):
@@ -106,7 +308,7 @@ class MardenMoodRule(LearningRule):
                 else:
                     new_hidden[i] = 'D'
 
-        return new_action, new_hidden
+        return new_hidden
     
 
 
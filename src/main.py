@@ -2,6 +2,7 @@ import argparse
 
 from src.game import game_dictionary
 from src.learning_rule import learning_rule_dictionary
+from src.telemetry import TelemetrySink
 from src.unified_learning import UnifiedLearning
 
 
@@ -41,6 +42,22 @@ def parse_args():
     
     parser.add_argument("--num-runs", type=int, default=1, 
                         help="Number of independent learning trajectories to run. ")
+    
+    parser.add_argument("--event-driven", action="store_true", default=False, 
+                        help="If present, the iterations in which nothing changes are skipped in bulk (same distribution, faster for small epsilon).")
+    
+    parser.add_argument("--buffered", action="store_true", default=False, 
+                        help="If present, the learning cycle runs on preallocated buffers, without allocations in the inner loop.")
+
+    parser.add_argument("--precision", type=str, default="float64", choices=["float64", "float32"],
+                        help="Precision of Q, V and rewards: float32 halves Q and the rewards, but the running means of V stay float64, "
+                             "so they take about 1.45x less memory overall (not 2x); actions and moods are int8 only in the buffered run.")
+    
+    parser.add_argument("--telemetry", type=str, default=None, 
+                        help="If present, progress records are appended to this file (JSON lines) during the runs.")
+    
+    parser.add_argument("--telemetry-interval", type=float, default=5.0, 
+                        help="Seconds between two telemetry records.")
 
     args = parser.parse_args()
     
@@ -48,6 +65,10 @@ def parse_args():
         parser.error("--iterations must be at least 1")
     if args.num_runs < 1:
         parser.error("--num-runs must be at least 1")
+    if args.event_driven and args.buffered:
+        parser.error("--event-driven and --buffered can't be used together")
+    if args.telemetry_interval <= 0:
+        parser.error("--telemetry-interval must be positive")
 
     return args
 
@@ -92,7 +113,10 @@ def main():
 
     game, learning_rule = objects_setup(args)
 
-    learner = UnifiedLearning(game=game, T=args.iterations, learning_rule=learning_rule)
+    telemetry = TelemetrySink(args.telemetry, interval=args.telemetry_interval) if args.telemetry else None
+
+    learner = UnifiedLearning(game=game, T=args.iterations, learning_rule=learning_rule, event_driven=args.event_driven, buffered=args.buffered,
+                              telemetry=telemetry, precision=args.precision)
     
     if args.num_runs > 1:
     
@@ -0,0 +1,149 @@
+import argparse
+
+import numpy as np
+
+from src.game import game_dictionary
+from src.learning_rule import learning_rule_dictionary
+from src.main import objects_setup
+from src.unified_learning import UnifiedLearning, precision_dictionary
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Drift of the reduced precision runs with respect to the double precision ones")
+
+    parser.add_argument("--iterations", type=int, default=10000, help="Learning iterations")
+    parser.add_argument("--num-runs", type=int, default=10, help="Number of runs for each precision")
+    parser.add_argument("--game", type=str, default="treasure", choices=list(game_dictionary),
+                        help="Game to play: treasure or staghunt")
+    parser.add_argument("--learning-rule", type=str, default="loglinear", choices=list(learning_rule_dictionary),
+                        help="Learning rule: loglinear or mardenmood")
+    parser.add_argument("--rule-coeffs", type=float, nargs="+", default=[0.01],
+                        help="Coefficients for the learning rule ([eps] for LogLinear, [eps,c] for MardenMood)")
+    parser.add_argument("--precision", type=str, default="float32", choices=[p for p in precision_dictionary if p != "float64"],
+                        help="Reduced precision to validate")
+    parser.add_argument("--tail", type=float, default=0.1,
+                        help="Final fraction of the iterations on which the selected equilibrium is computed")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the first run, the others follow")
+    parser.add_argument("--event-driven", action="store_true", default=False, help="If present, uses the event-driven run")
+    parser.add_argument("--buffered", action="store_true", default=False, help="If present, uses the buffered run")
+
+    args = parser.parse_args()
+
+    if args.iterations < 1:
+        parser.error("--iterations must be at least 1")
+    if args.num_runs < 1:
+        parser.error("--num-runs must be at least 1")
+    if not 0 < args.tail <= 1:
+        parser.error("--tail must be in (0,1]")
+    if args.event_driven and args.buffered:
+        parser.error("--event-driven and --buffered can't be used together")
+
+    return args
+
+
+def selected_equilibrium(s1_action_history, tail=0.1):
+    """ Joint action in s1 played most often in the final tail fraction of the iterations. """
+    history = np.asarray(s1_action_history)
+    last = history[-max(1, int(len(history) * tail)):]
+    actions, counts = np.unique(last, axis=0, return_counts=True)
+    return tuple(int(x) for x in actions[np.argmax(counts)])
+
+
+def memory_footprint(learner):
+    """ Bytes taken by Q, V (with its double precision running means, when kept apart) and the rewards of the learner. """
+    rewards_bytes = sum(reward_matrix.nbytes for stage_data in learner.game.rewards.values() for reward_matrix in stage_data.values())
+    V_mean_bytes = learner._V_mean.nbytes if learner._V_mean is not learner.V else 0
+    return learner.Q.nbytes + learner.V.nbytes + V_mean_bytes + rewards_bytes
+
+
+def validate_precision(game, learning_rule, T, num_runs, precision="float32", tail=0.1, seed=0, **run_options):
+    """
+    Runs the learning process in double and in reduced precision, with the same seed for the two runs of each pair,
+    and measures how far the reduced precision drifts.
+    The two trajectories of a pair start identical but can split after any sampling decided by a rounding difference,
+    so besides the pairwise drift the distribution of the selected equilibria is compared as well.
+
+    Args:
+        game (Game), learning_rule (LearningRule), T (int): as for UnifiedLearning.
+        num_runs (int): number of pairs of runs.
+        precision (str): reduced precision to validate (key of precision_dictionary).
+        tail (float): final fraction of the iterations on which the selected equilibrium is computed.
+        seed (int): seed of the first pair, the next ones use the following integers.
+        run_options: other arguments of UnifiedLearning (event_driven, buffered).
+
+    Returns:
+        dict: per-run and summary statistics.
+    """
+    learners = {
+        "float64": UnifiedLearning(game=game, T=T, learning_rule=learning_rule, precision="float64", **run_options),
+        precision: UnifiedLearning(game=game, T=T, learning_rule=learning_rule, precision=precision, **run_options),
+    }
+
+    runs = []
+    for r in range(num_runs):
+        results = {}
+        for name, learner in learners.items():
+            np.random.seed(seed + r)
+            learner._reset()
+            learner.run()
+            results[name] = {
+                "V_s1": float(learner.V[0, 1, 0]),
+                "V_history": np.asarray(learner.V_history, dtype=np.float64),
+                "equilibrium": selected_equilibrium(learner.s1_action_history, tail),
+            }
+
+        double, reduced = results["float64"], results[precision]
+        runs.append({
+            "V_s1_float64": double["V_s1"],
+            "V_s1_reduced": reduced["V_s1"],
+            "V_s1_drift": abs(reduced["V_s1"] - double["V_s1"]),
+            "V_history_max_drift": float(np.max(np.abs(reduced["V_history"] - double["V_history"]))),
+            "equilibrium_float64": double["equilibrium"],
+            "equilibrium_reduced": reduced["equilibrium"],
+        })
+
+    def equilibrium_freq(key):
+        equilibria = [run[key] for run in runs]
+        return {eq: equilibria.count(eq) / num_runs for eq in sorted(set(equilibria))}
+
+    V_double = np.array([run["V_s1_float64"] for run in runs])
+    V_reduced = np.array([run["V_s1_reduced"] for run in runs])
+    summary = {
+        "mean_V_s1_float64": float(V_double.mean()),
+        "mean_V_s1_reduced": float(V_reduced.mean()),
+        "mean_V_s1_drift": float(np.mean([run["V_s1_drift"] for run in runs])),
+        "max_V_s1_drift": float(np.max([run["V_s1_drift"] for run in runs])),
+        "same_equilibrium": sum(run["equilibrium_float64"] == run["equilibrium_reduced"] for run in runs) / num_runs,
+        "equilibria_float64": equilibrium_freq("equilibrium_float64"),
+        "equilibria_reduced": equilibrium_freq("equilibrium_reduced"),
+        "memory_float64": memory_footprint(learners["float64"]),
+        "memory_reduced": memory_footprint(learners[precision]),
+    }
+    # the running means of V stay in double precision, so the saving is less than the ratio of the dtype sizes
+    summary["memory_ratio"] = summary["memory_float64"] / summary["memory_reduced"]
+    return {"runs": runs, "summary": summary}
+
+
+def main():
+    args = parse_args()
+    game, learning_rule = objects_setup(args)
+
+    report = validate_precision(game, learning_rule, args.iterations, args.num_runs, precision=args.precision,
+                                tail=args.tail, seed=args.seed, event_driven=args.event_driven, buffered=args.buffered)
+
+    print(f"{'run':<5}{'V(s1) float64':>15}{'V(s1) ' + args.precision:>15}{'drift':>11}{'max drift':>11}  equilibria")
+    for r, run in enumerate(report["runs"]):
+        print(f"{r:<5}{run['V_s1_float64']:>15.6f}{run['V_s1_reduced']:>15.6f}{run['V_s1_drift']:>11.2e}"
+              f"{run['V_history_max_drift']:>11.2e}  {run['equilibrium_float64']} / {run['equilibrium_reduced']}")
+
+    summary = report["summary"]
+    print(f"\nMean V(s1): float64 {summary['mean_V_s1_float64']:.6f}, {args.precision} {summary['mean_V_s1_reduced']:.6f}")
+    print(f"V(s1) drift: mean {summary['mean_V_s1_drift']:.2e}, max {summary['max_V_s1_drift']:.2e}")
+    print(f"Same selected equilibrium: {summary['same_equilibrium']:.0%} of the runs")
+    print(f"Selected equilibria: float64 {summary['equilibria_float64']}, {args.precision} {summary['equilibria_reduced']}")
+    print(f"Memory of Q, V (and its running means) and rewards: float64 {summary['memory_float64']} B, "
+          f"{args.precision} {summary['memory_reduced']} B ({summary['memory_ratio']:.2f}x less)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import argparse
+import datetime
+import json
+import os
+import time
+
+
+class TelemetrySink:
+    """
+    Appends JSON-lines progress records of the learning runs to a file, at most one every `interval` seconds
+    of wall-clock time, plus a final one when the last run ends.
+    Each record holds iterations per second, V(s1), the empirical frequencies of the joint actions in s1,
+    the mood fractions (Marden Mood only) and the estimated time remaining.
+    """
+    def __init__(self, path, interval=5.0):
+        if interval <= 0:
+            raise ValueError("The telemetry interval has to be positive.")
+        self.path = path
+        self.interval = interval
+
+        output_dir = os.path.dirname(path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+        self.num_runs = 0       # runs of the current job
+        self.run = 0            # runs started so far in the current job
+
+
+    def start_job(self, iterations_per_run, num_runs=1):
+        """ Starts timing a job of num_runs runs, each of iterations_per_run iterations. """
+        self.iterations_per_run = iterations_per_run
+        self.num_runs = num_runs
+        self.run = 0
+        self._job_start = self._last_time = time.monotonic()
+        self._last_done = 0
+        self._next_time = self._job_start + self.interval
+
+
+    def start_run(self, iterations_per_run):
+        """ Called at the start of each run: a run outside of a job (or after its last run) is a job of its own. """
+        if self.run >= self.num_runs:
+            self.start_job(iterations_per_run)
+        self.run += 1
+
+
+    def due(self):
+        """ True if the interval since the last record has passed. """
+        return time.monotonic() >= self._next_time
+
+
+    def end_run(self, done, state):
+        """ Called at the end of each run, writes the final record after the last one. """
+        if self.run == self.num_runs:
+            self.write(done, state, final=True)
+
+
+    def write(self, done, state, final=False):
+        """
+        Appends a record.
+
+        Args:
+            done (int): iterations completed in the current run.
+            state (dict): values of the learner to report (V(s1), s1 frequencies, mood fractions).
+            final (bool): True for the record closing the job.
+        """
+        now = time.monotonic()
+        done_total = (self.run - 1) * self.iterations_per_run + done
+        remaining = self.num_runs * self.iterations_per_run - done_total
+
+        # iterations per second since the previous record, ETA from the average speed of the whole job
+        it_per_s = (done_total - self._last_done) / (now - self._last_time) if now > self._last_time else 0.0
+        avg_it_per_s = done_total / (now - self._job_start) if now > self._job_start else 0.0
+        eta_s = remaining / avg_it_per_s if avg_it_per_s > 0 else None
+
+        record = {
+            "time": datetime.datetime.now().isoformat(timespec="seconds"),
+            "elapsed_s": round(now - self._job_start, 3),
+            "run": self.run,
+            "num_runs": self.num_runs,
+            "iteration": done,
+            "iterations": self.iterations_per_run,
+            "it_per_s": round(it_per_s, 1),
+            "eta_s": None if eta_s is None else round(eta_s, 1),
+            **state,
+            "final": final,
+        }
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+        self._last_time = now
+        self._last_done = done_total
+        self._next_time = now + self.interval
+
+
+def format_record(record):
+    """ One line progress summary of a telemetry record. """
+    progress = record["iteration"] / record["iterations"]
+    eta = "-" if record["eta_s"] is None else str(datetime.timedelta(seconds=round(record["eta_s"])))
+
+    line = (f"run {record['run']}/{record['num_runs']}  it {record['iteration']}/{record['iterations']} ({progress:.1%})  "
+            f"{record['it_per_s']:.0f} it/s  V(s1)={record['V_s1']:.4f}  ")
+    line += "s1: " + " ".join(f"{action} {freq:.1%}" for action, freq in record["s1_action_freq"].items())
+    if record.get("mood_fractions") is not None:
+        line += "  moods: " + " ".join(f"{mood} {frac:.1%}" for mood, frac in record["mood_fractions"].items())
+    line += f"  ETA {eta}"
+    if record["final"]:
+        line += "  (done)"
+    return line
+
+
+def follow_summary(path, follow=False, poll=1.0):
+    """ Prints the summary of each record of the telemetry file; with follow, waits for new ones like tail -f. """
+    while follow and not os.path.exists(path):
+        time.sleep(poll)
+
+    with open(path) as f:
+        pending = ""        # last line, while it's still being written
+        while True:
+            line = f.readline()
+            if not line:
+                if not follow:
+                    return
+                time.sleep(poll)
+                continue
+
+            pending += line
+            if pending.endswith("\n"):
+                record = json.loads(pending)
+                pending = ""
+                print(format_record(record), flush=True)
+                if follow and record["final"]:
+                    return
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Progress summary of a telemetry file")
+    parser.add_argument("path", type=str, help="Telemetry file (JSON lines)")
+    parser.add_argument("--follow", action="store_true", default=False,
+                        help="If present, keeps waiting for new records until the job ends")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    follow_summary(args.path, follow=args.follow)
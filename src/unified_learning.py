@@ -1,26 +1,48 @@
 import numpy as np
 import matplotlib.pyplot as plt
 import copy
+from collections import Counter
 from tqdm import tqdm
 
 from src.game import Game 
-from src.learning_rule import MardenMoodRule
+from src.learning_rule import MardenMoodRule, UniformStream
 from src.plot_utils import HistoryAnalysisMixin
 
 
+# Lookup table: precision -> (dtype of Q, V and rewards, dtype of the stored actions and moods codes)
+precision_dictionary = {
+    "float64": (np.float64, np.int64),
+    "float32": (np.float32, np.int8),
+}
+
+
 class UnifiedLearning(HistoryAnalysisMixin):
     """
     Implements the algorithm Unified Learning Framework for a multi-agent game with finite horizon and two players.
     """
-    def __init__(self, game, T, learning_rule, save=False, save_path=None, no_override=False):
+    def __init__(self, game, T, learning_rule, save=False, save_path=None, no_override=False, event_driven=False, buffered=False,
+                 telemetry=None, precision="float64"):
         self.T = T          # number of learning iterations
         self.learning_rule = learning_rule
+        self.event_driven = event_driven    # skips in bulk the iterations in which actions and hidden vars don't change
+        self.buffered = buffered            # runs on preallocated double buffers, without allocations in the inner loop
+        if event_driven and buffered:
+            raise ValueError("The event-driven and the buffered runs can't be used together.")
+        self.telemetry = telemetry          # TelemetrySink receiving progress records during the runs, or None
+
+        if precision not in precision_dictionary:
+            raise ValueError(f"Precision not valid: {precision}")
+        self.precision = precision
+        self.float_dtype, self.code_dtype = precision_dictionary[precision]
 
         if learning_rule.norm_rewards:
             self.game = self._normalize_rewards(game, learning_rule.reward_prec)
         else:
             self.game = game
 
+        if self.float_dtype != np.float64:
+            self.game = self._cast_rewards(self.game, self.float_dtype)
+
         #output parameters
         self._save = save
         self._save_path = save_path
@@ -29,10 +51,14 @@ class UnifiedLearning(HistoryAnalysisMixin):
         # Definition of variables
 
         # Q[player][stage h][state_index][action_pl1][action_pl2]
-        self.Q = np.zeros((self.game.N, self.game.H + 1, len(self.game.s_map[2]), len(self.game.actions), len(self.game.actions)))
+        self.Q = np.zeros((self.game.N, self.game.H + 1, len(self.game.s_map[2]), len(self.game.actions), len(self.game.actions)), dtype=self.float_dtype)
 
         # V[player][stage h][state_index]
-        self.V = np.zeros((self.game.N, self.game.H + 2, len(self.game.s_map[2])))
+        self.V = np.zeros((self.game.N, self.game.H + 2, len(self.game.s_map[2])), dtype=self.float_dtype)
+
+        # running means behind V, always in double precision: a float32 mean would stop moving once (q - V)/(t + 1)
+        # drops below half an ulp of V, so in reduced precision V only holds their rounded copy
+        self._V_mean = self.V if self.float_dtype == np.float64 else np.zeros(self.V.shape)
         
         # a[stage h][state_index] -> (a1, a2)
         self.a = {}
@@ -43,69 +69,45 @@ class UnifiedLearning(HistoryAnalysisMixin):
         # Save cronology of the state s1 to check convergence
         self.V_history = []             # V-value just of player 0 (we have symmetric games)
         self.s1_action_history = []     # pair of actions taken by both players
+        self.s1_action_runs = []        # run-length encoding [action pair, count] (filled only by the event-driven run)
 
 
     def run(self):
         """ Run of the main learning cycle. """
+        if self.telemetry is not None:
+            self.telemetry.start_run(self.T)
+            self._s1_counts = Counter()     # s1 joint actions counted so far for the telemetry
+            self._counted = 0               # iterations (or closed runs, for the event-driven run) already counted
+
+        if self.event_driven:
+            self._run_event_driven()
+        elif self.buffered:
+            self._run_buffered()
+        else:
+            self._run_plain()
+
+        if self.telemetry is not None:
+            self.telemetry.end_run(self.T, self._progress_state(self.T))
+
+
+    def _run_plain(self):
+        """ Step by step run of the learning cycle. """
         self._initialize()
 
         for t in range(self.T):
 
-            V_t = np.copy(self.V)
-            self.V_history.append(V_t[0, 1, 0])
+            self.V_history.append(self.V[0, 1, 0])
 
-            for h in range(self.game.H, 0, -1):
-                
-                # Actor: computes new actions and new auxiliary variables for all the states in stage h, using Q^(t)
-                new_action_h = {}   #a_h_t_plus
-                new_hidden_h = {}
-
-                for s_str, s_idx in self.game.s_map[h].items():
-                    current_a = self.a[h][s_idx]
-                    current_hid = self.hidden[h][s_idx]
-
-                    q_vals = self.Q[:, h, s_idx, :, :]
-                             
-                    new_action_h[s_idx], new_hidden_h[s_idx] = self.learning_rule.update_vars(current_a, current_hid, self.game.N, self.game.actions, q_vals)
-
-
-                # Critic: updates V_{i,h} and Q_{i,h} for all the states in stage h, based on the new actions
-                for s_str, s_idx in self.game.s_map[h].items():
-                                        
-                    # V-values update
-                    t_joint_action = self.a[h][s_idx] 
-                    for i in range(self.game.N):
-                        q_val_t = self.Q[i, h, s_idx, t_joint_action[0], t_joint_action[1]]
-                        
-                        # Calcola la media mobile
-                        if t == 0:
-                           self.V[i, h, s_idx] = q_val_t
-                        else:
-                           old_v = V_t[i, h, s_idx]
-                           self.V[i, h, s_idx] = (t / (t + 1)) * old_v + (1 / (t + 1)) * q_val_t
-
-                    # Q-values update
-                    for i in range(self.game.N):
-                        for a1 in self.game.actions:
-                            for a2 in self.game.actions:
-                                expected_V = 0
-                                if h < self.game.H: # Per h=1, calcola il valore atteso da h=2
-                                    next_s_str = self.game.transition(a1, a2)
-                                    next_s_idx = self.game.s_map[h + 1][next_s_str]
-                                    expected_V = self.V[i, h + 1, next_s_idx]
-                                
-                                reward = self.game.rewards[h][s_str][a1,a2]
-                                self.Q[i, h, s_idx, a1, a2] = reward[i] + expected_V
-
-                # Save variables new values
-                self.a[h] = new_action_h  
-                self.hidden[h] = new_hidden_h              
+            self._step(t)
             
             # Save history of the initial state
             action_in_s1 = self.a[1][0]         # actions taken in h=1, s_idx=0
 
             self.s1_action_history.append(action_in_s1)
 
+            if self.telemetry is not None:
+                self._report_progress(t + 1)
+
 
     def run_simulations(self, num_runs):
         """ Executes num_runs simulations of the learning process. """
@@ -113,6 +115,8 @@ class UnifiedLearning(HistoryAnalysisMixin):
         # all_runs_value = []
 
         print(f"Starting {num_runs} simulations...")
+        if self.telemetry is not None:
+            self.telemetry.start_job(self.T, num_runs)
         for _ in tqdm(range(num_runs), desc="Runs", unit="run", ncols=70):
             self._reset()
             self.run()   
@@ -123,6 +127,387 @@ class UnifiedLearning(HistoryAnalysisMixin):
     
 
 
+    def _step(self, t):
+        """ Single iteration t of the learning cycle, for all the stages. """
+        for h in range(self.game.H, 0, -1):
+            
+            # Actor: computes new actions and new auxiliary variables for all the states in stage h, using Q^(t)
+            new_action_h = {}   #a_h_t_plus
+            new_hidden_h = {}
+
+            for s_str, s_idx in self.game.s_map[h].items():
+                current_a = self.a[h][s_idx]
+                current_hid = self.hidden[h][s_idx]
+
+                q_vals = self.Q[:, h, s_idx, :, :]
+                         
+                new_action_h[s_idx], new_hidden_h[s_idx] = self.learning_rule.update_vars(current_a, current_hid, self.game.N, self.game.actions, q_vals)
+
+            # Critic: updates V_{i,h} and Q_{i,h} for all the states in stage h, based on the new actions
+            self._critic(t, h)
+
+            # Save variables new values
+            self.a[h] = new_action_h  
+            self.hidden[h] = new_hidden_h              
+
+
+    def _critic(self, t, h):
+        """ Updates V_{i,h} and Q_{i,h} for all the states in stage h, based on the actions of iteration t. """
+        for s_idx in self._state_indices[h]:
+            t_joint_action = self.a[h][s_idx]
+            a1, a2 = int(t_joint_action[0]), int(t_joint_action[1])
+            self._critic_state(float(t), h, s_idx, a1, a2, self._V_mean, self._V_mean)
+
+        if self._V_mean is not self.V:      # reduced precision: V holds the rounded copy of the running means
+            self.V[:, h] = self._V_mean[:, h]
+
+
+    def _critic_state(self, t_float, h, s_idx, a1, a2, V_cur, V_nxt):
+        """
+        Critic of the state s_idx of stage h, shared by the plain and the buffered runs: V_{i,h} is the running mean of
+        the Q-values of the joint actions (a1, a2) taken so far, then Q_{i,h} is backed up from the V-values of stage h+1.
+        The means are read from V_cur and written in V_nxt, both double precision: the two buffers of the buffered run,
+        or _V_mean twice in the plain run. t is passed as a float, since arithmetic on large python ints allocates.
+        """
+        q_vals = self._q_views[h][s_idx]
+
+        # V-values update: running mean
+        for i in self._players:
+            q_val_t = q_vals.item(i, a1, a2)
+            if t_float == 0:
+                V_nxt[i, h, s_idx] = q_val_t
+            else:
+                V_nxt[i, h, s_idx] = (t_float / (t_float + 1)) * V_cur.item(i, h, s_idx) + (1 / (t_float + 1)) * q_val_t
+
+        # Q-values update
+        rewards = self._reward_list[h][s_idx]
+        for i in self._players:
+            for b1 in self.game.actions:
+                for b2 in self.game.actions:
+                    expected_V = 0.0
+                    if h < self.game.H:     # for h=1, expected value from h=2
+                        expected_V = V_nxt.item(i, h + 1, self._next_list[h][b1][b2])
+                    q_vals[i, b1, b2] = rewards[i][b1][b2] + expected_V
+
+
+    def _build_critic_tables(self):
+        """ Python tables and views on Q read by the critic, built once so that it only indexes them. """
+        N = self.game.N
+        self._state_indices = {h: list(range(len(self.game.s_map[h]))) for h in range(1, self.game.H + 1)}
+        self._q_views = {h: [self.Q[:, h, s_idx, :, :] for s_idx in self._state_indices[h]]
+                         for h in range(1, self.game.H + 1)}
+
+        # reward_list[h][state_index][player][a1][a2], next_list[h][a1][a2] -> state index in stage h+1
+        self._reward_list = {h: [[[[float(self.game.rewards[h][s_str][a1, a2][i]) for a2 in self.game.actions]
+                                   for a1 in self.game.actions] for i in range(N)]
+                                 for s_str in sorted(self.game.s_map[h], key=self.game.s_map[h].get)]
+                             for h in range(1, self.game.H + 1)}
+        self._next_list = {h: [[self.game.s_map[h + 1][self.game.transition(a1, a2)] for a2 in self.game.actions]
+                               for a1 in self.game.actions] for h in range(1, self.game.H)}
+        self._stages = list(range(self.game.H, 0, -1))
+        self._players = list(range(N))
+
+
+    def _run_event_driven(self, window=1 << 12):
+        """
+        Run of the learning cycle with the same distribution of run(), skipping ahead the iterations in which the
+        actions and hidden variables of a state don't change.
+        Given Q, the states evolve independently, and Q_h only depends on the V-values of stage h+1: Q_H is constant,
+        so the states of stage H are simulated on their own, then the ones of each stage h on the Q_h of the whole window.
+        Each state has its own clock: the iterations up to its next candidate change are drawn from a geometric
+        distribution, whose rate bounds the change probability until the end of the window, and each candidate is
+        accepted with the exact change probability (thinning). V is advanced in bulk from the resulting sequences and
+        the s1 actions are appended to the history as run-length encoded segments.
+        """
+        self._initialize()
+        self._build_event_tables()
+        self.V_history = np.empty(self.T, dtype=self.float_dtype)
+
+        t = 0
+        while t < self.T:
+            self._report_progress(t)
+            # short windows at the start, while V moves fast and the bounds on Q are loose
+            W = min(window, self.T - t, max(t, 64))
+            self._advance_window(t, W)
+            t += W
+
+        runs_actions = np.array([action for action, _ in self.s1_action_runs], dtype=self.code_dtype)
+        runs_counts = [count for _, count in self.s1_action_runs]
+        self.s1_action_history = np.repeat(runs_actions, runs_counts, axis=0)
+
+
+    def _build_event_tables(self):
+        """ Array versions of rewards and transitions, used by the bulk updates of the event-driven run. """
+        A = len(self.game.actions)
+
+        # rewards_arr[h][player, state_index, action_pl1, action_pl2]
+        self._rewards_arr = {}
+        for h in range(1, self.game.H + 1):
+            self._rewards_arr[h] = np.zeros((self.game.N, len(self.game.s_map[h]), A, A), dtype=self.float_dtype)
+            for s_str, s_idx in self.game.s_map[h].items():
+                self._rewards_arr[h][:, s_idx] = np.moveaxis(self.game.rewards[h][s_str], -1, 0)
+
+        # next_idx[h][action_pl1, action_pl2] -> state index in stage h+1
+        self._next_idx = {}
+        for h in range(1, self.game.H):
+            self._next_idx[h] = np.array([[self.game.s_map[h + 1][self.game.transition(a1, a2)]
+                                           for a2 in self.game.actions] for a1 in self.game.actions])
+
+
+    def _advance_window(self, t, W):
+        """ Advances by the W iterations starting from t, stage by stage from H to 1. """
+        V_traj = {}     # V_traj[h][player, state_index, k] = V after iteration t + k
+
+        for h in range(self.game.H, 0, -1):
+            S = len(self.game.s_map[h])
+
+            if h == self.game.H:
+                Q_h = self.Q[:, h, :S]
+                q_at = lambda s_idx, k: Q_h[:, s_idx]
+                q_bounds = lambda s_idx, k: (Q_h[:, s_idx], Q_h[:, s_idx])
+            else:
+                # Q_traj[player, state_index, a1, a2, k] = Q_h at the start of iteration t + k
+                S_next = len(self.game.s_map[h + 1])
+                V_next = np.concatenate((self._V_mean[:, h + 1, :S_next, None], V_traj[h + 1][..., :-1]), axis=2)
+                Q_traj = self._rewards_arr[h][..., None] + V_next[:, self._next_idx[h]][:, None]
+                Q_low = np.minimum.accumulate(Q_traj[..., ::-1], axis=-1)[..., ::-1]
+                Q_high = np.maximum.accumulate(Q_traj[..., ::-1], axis=-1)[..., ::-1]
+                q_at = lambda s_idx, k: Q_traj[:, s_idx, :, :, k]
+                q_bounds = lambda s_idx, k: (Q_low[:, s_idx, :, :, k], Q_high[:, s_idx, :, :, k])
+
+            # Q-values sampled by the critic at each iteration, given the actions of the sequence
+            q_samples = np.zeros((self.game.N, S, W))
+            for s_idx in range(S):
+                changes = self._simulate_state(h, s_idx, W, q_at, q_bounds)
+                starts = [k for k, _, _ in changes] + [W]
+                lengths = np.diff(starts)
+                a1_seq = np.repeat([int(action[0]) for _, action, _ in changes], lengths)
+                a2_seq = np.repeat([int(action[1]) for _, action, _ in changes], lengths)
+                if h == self.game.H:
+                    q_samples[:, s_idx] = Q_h[:, s_idx, a1_seq, a2_seq]
+                else:
+                    q_samples[:, s_idx] = Q_traj[:, s_idx, a1_seq, a2_seq, np.arange(W)]
+
+                _, self.a[h][s_idx], self.hidden[h][s_idx] = changes[-1]
+                if h == 1 and s_idx == 0:
+                    self._record_s1_changes(changes, W)
+
+            # long sums are accumulated in double precision whatever the storage one
+            steps = np.arange(t + 1, t + W + 1)
+            V_traj[h] = (t * self._V_mean[:, h, :S, None] + np.cumsum(q_samples, axis=2, dtype=np.float64)) / steps
+
+        self.V_history[t] = self.V[0, 1, 0]
+        self.V_history[t + 1:t + W] = V_traj[1][0, 0, :-1]
+
+        for h in range(self.game.H, 0, -1):
+            S = len(self.game.s_map[h])
+            self._V_mean[:, h, :S] = V_traj[h][..., -1]
+            self.V[:, h, :S] = V_traj[h][..., -1]
+            if h < self.game.H:
+                self.Q[:, h, :S] = self._rewards_arr[h] + self._V_mean[:, h + 1][:, self._next_idx[h]][:, None]
+
+
+    def _simulate_state(self, h, s_idx, W, q_at, q_bounds):
+        """
+        Actions and hidden vars of state s_idx of stage h over the W iterations of the window.
+        q_at(s_idx, k) gives its Q-values at the start of iteration k of the window, q_bounds(s_idx, k) their minimum
+        and maximum over the iterations from k to the end of the window.
+
+        Returns:
+            list: changes (k, action, hidden), the values holding from iteration k of the window (the first one has k=0).
+        """
+        rule, N, actions = self.learning_rule, self.game.N, self.game.actions
+        action, hidden = self.a[h][s_idx], self.hidden[h][s_idx]
+        changes = [(0, action, hidden)]
+
+        k = 0
+        while k < W:
+            hold_bound = rule.hold_probability(action, hidden, N, actions, *q_bounds(s_idx, k))
+
+            if hold_bound is None:
+                # no closed form for these hidden vars: plain step of this state
+                new_action, new_hidden = rule.update_vars(action, hidden, N, actions, q_at(s_idx, k))
+                k += 1
+                if list(new_action) != list(action) or list(new_hidden) != list(hidden):
+                    action, hidden = new_action, new_hidden
+                    changes.append((k, action, hidden))
+                continue
+
+            change_bound = 1 - hold_bound
+            if change_bound <= 0:
+                break
+            k += np.random.geometric(change_bound) - 1      # next candidate change
+            if k >= W:
+                break
+
+            q_vals = q_at(s_idx, k)
+            hold = rule.hold_probability(action, hidden, N, actions, q_vals)
+            if np.random.rand() * change_bound < 1 - hold:
+                action, hidden = rule.sample_change(action, hidden, N, actions, q_vals)
+                changes.append((k + 1, action, hidden))
+            k += 1
+
+        return changes
+
+
+    def _record_s1_changes(self, changes, W):
+        """ Appends to the run-length encoded history the s1 actions after each iteration of the window. """
+        # the action after iteration k is the one holding from iteration k+1
+        starts = [max(k - 1, 0) for k, _, _ in changes] + [W]
+        for (_, action, _), start, end in zip(changes, starts, starts[1:]):
+            if end > start:
+                self._record_s1(action, end - start)
+
+
+    def _record_s1(self, action, count):
+        """ Appends count iterations with the given action in s1 to the run-length encoded history. """
+        action_in_s1 = tuple(int(x) for x in action)
+        if self.s1_action_runs and self.s1_action_runs[-1][0] == action_in_s1:
+            self.s1_action_runs[-1][1] += count
+        else:
+            self.s1_action_runs.append([action_in_s1, count])
+
+
+    def _run_buffered(self):
+        """
+        Run of the learning cycle on preallocated buffers: actions, hidden vars and the running means of V are
+        double-buffered (values of iteration t are read from one buffer and the ones of t+1 written in the other, then
+        the roles are swapped), the learning rule writes into the buffers through update_vars_into and the histories
+        are preallocated arrays. V and _V_mean are only written at the end, by _store_buffers.
+        """
+        self._initialize()
+        self._load_buffers()
+
+        for t in range(self.T):
+            self._buffered_step(t)
+            if self.telemetry is not None:
+                self._report_progress(t + 1)
+
+        self._store_buffers()
+
+
+    def _load_buffers(self):
+        """ Allocates the buffers of the buffered run and fills them with the current values of V, a and hidden. """
+        N, S = self.game.N, len(self.game.s_map[2])
+        hidden_values = self.learning_rule.hidden_values
+
+        # a_buf[buffer][stage h][state_index][player], hidden_buf idem with the indices of hidden_values
+        self._a_buf = np.zeros((2, self.game.H + 1, S, N), dtype=self.code_dtype)
+        self._hidden_buf = np.zeros((2, self.game.H + 1, S, N), dtype=self.code_dtype)
+        for h in range(1, self.game.H + 1):
+            for s_idx in self.a[h]:
+                self._a_buf[:, h, s_idx] = self.a[h][s_idx]
+                self._hidden_buf[:, h, s_idx] = [hidden_values.index(x) for x in self.hidden[h][s_idx]]
+
+        # V_buf[buffer][player][stage h][state_index]: running means, in double precision whatever the precision of V
+        self._V_buf = np.zeros((2,) + self.V.shape)
+        self._V_buf[:] = self._V_mean
+
+        # views and python tables built once, so that the inner loop only indexes them
+        self._V_views = [self._V_buf[k] for k in range(2)]
+        self._a_views = [{h: [self._a_buf[k, h, s_idx] for s_idx in range(len(self.game.s_map[h]))]
+                          for h in range(1, self.game.H + 1)} for k in range(2)]
+        self._hidden_views = [{h: [self._hidden_buf[k, h, s_idx] for s_idx in range(len(self.game.s_map[h]))]
+                               for h in range(1, self.game.H + 1)} for k in range(2)]
+        self._uniforms = UniformStream()
+
+        self.V_history = np.empty(self.T, dtype=self.float_dtype)
+        self.s1_action_history = np.empty((self.T, N), dtype=self.code_dtype)
+
+
+    def _buffered_step(self, t):
+        """ Single iteration t of the buffered run: reads buffer t % 2, writes buffer (t+1) % 2. """
+        cur = t & 1
+        nxt = cur ^ 1
+        V_cur, V_nxt = self._V_views[cur], self._V_views[nxt]
+        a_cur, a_nxt = self._a_views[cur], self._a_views[nxt]
+        hidden_cur, hidden_nxt = self._hidden_views[cur], self._hidden_views[nxt]
+        t_float = float(t)      # arithmetic on large python ints allocates, on floats it doesn't
+
+        self.V_history[t] = V_cur.item(0, 1, 0)
+
+        for h in self._stages:
+            states = self._state_indices[h]
+            q_views = self._q_views[h]
+            a_cur_h = a_cur[h]
+
+            # Actor: new actions and auxiliary variables of stage h, written in the other buffer
+            for s_idx in states:
+                self.learning_rule.update_vars_into(a_cur_h[s_idx], hidden_cur[h][s_idx], self.game.N, self.game.actions,
+                                                    q_views[s_idx], a_nxt[h][s_idx], hidden_nxt[h][s_idx], self._uniforms)
+
+            # Critic: V_{i,h} and Q_{i,h} of stage h, based on the actions of iteration t
+            for s_idx in states:
+                self._critic_state(t_float, h, s_idx, a_cur_h[s_idx].item(0), a_cur_h[s_idx].item(1), V_cur, V_nxt)
+
+        a_s1 = a_nxt[1][0]
+        for i in self._players:
+            self.s1_action_history[t, i] = a_s1.item(i)
+
+
+    def _store_buffers(self):
+        """ Copies back the last values of the buffered run into V (and its running means), a and hidden. """
+        last = self.T & 1
+        hidden_values = self.learning_rule.hidden_values
+        self._V_mean[:] = self._V_buf[last]
+        self.V[:] = self._V_buf[last]
+        for h in range(1, self.game.H + 1):
+            for s_idx in self.a[h]:
+                self.a[h][s_idx] = [int(x) for x in self._a_buf[last, h, s_idx]]
+                self.hidden[h][s_idx] = [hidden_values[code] for code in self._hidden_buf[last, h, s_idx]]
+
+
+    def _report_progress(self, done):
+        """ Writes a telemetry record after done iterations of the current run, if there is a sink and it's time. """
+        if self.telemetry is not None and done > 0 and self.telemetry.due():
+            self.telemetry.write(done, self._progress_state(done))
+
+
+    def _progress_state(self, done):
+        """ V(s1), empirical frequencies of the joint actions in s1 and mood fractions after done iterations. """
+        if self.buffered:
+            V_s1 = self._V_views[done & 1].item(0, 1, 0)
+        else:
+            V_s1 = float(self.V[0, 1, 0])
+
+        counts = self._s1_action_counts(done)
+        s1_action_freq = {f"{a1},{a2}": counts[(a1, a2)] / done for a1 in self.game.actions for a2 in self.game.actions}
+
+        mood_fractions = None
+        if isinstance(self.learning_rule, MardenMoodRule):
+            if self.buffered:
+                moods = [self.learning_rule.hidden_values[code] for h in range(1, self.game.H + 1)
+                         for s_idx in range(len(self.game.s_map[h])) for code in self._hidden_buf[done & 1, h, s_idx]]
+            else:
+                moods = [mood for h in self.hidden for hidden in self.hidden[h].values() for mood in hidden]
+            content = sum(mood == 'C' for mood in moods) / len(moods)
+            mood_fractions = {"C": content, "D": 1 - content}
+
+        return {"V_s1": V_s1, "s1_action_freq": s1_action_freq, "mood_fractions": mood_fractions}
+
+
+    def _s1_action_counts(self, done):
+        """ Counts of the joint actions in s1 over the first done iterations, counting only the new ones at each call. """
+        if self.event_driven:
+            # the last run of the encoding can still grow: only the closed ones are added to the counts
+            runs = self.s1_action_runs
+            for action, count in runs[self._counted:len(runs) - 1]:
+                self._s1_counts[action] += count
+            self._counted = max(self._counted, len(runs) - 1)
+            counts = Counter(self._s1_counts)
+            if runs:
+                counts[runs[-1][0]] += runs[-1][1]
+            return counts
+
+        if done > self._counted:
+            new_actions = np.asarray(self.s1_action_history[self._counted:done])
+            rows, row_counts = np.unique(new_actions, axis=0, return_counts=True)
+            for row, count in zip(rows, row_counts):
+                self._s1_counts[tuple(int(x) for x in row)] += int(count)
+            self._counted = done
+        return self._s1_counts
+
+
     def _initialize(self):
         """ Initialisation of Q-values, actions and hidden variables. """
         
@@ -139,6 +524,8 @@ class UnifiedLearning(HistoryAnalysisMixin):
                         for i in range(self.game.N):
                             self.Q[i, h, s_idx, a1, a2] = reward[i]
 
+        self._build_critic_tables()
+
         # Actions and hidden variables are initialised randomly
         for h in range(1, self.game.H + 1):
             self.a[h] = {}
@@ -178,15 +565,24 @@ class UnifiedLearning(HistoryAnalysisMixin):
         return g
 
 
+    def _cast_rewards(self, game: Game, dtype) -> Game:
+        g = copy.deepcopy(game)
+        g.rewards = {stage: {state: reward_matrix.astype(dtype) for state, reward_matrix in stage_data.items()}
+                     for stage, stage_data in g.rewards.items()}
+        return g
+
+
     def _reset(self):
         """
         Resets the attributes Q, V, a, hidden and the histories to the initial values (like in __init__).
         """
         self.Q.fill(0) 
         self.V.fill(0) 
+        self._V_mean.fill(0)
 
         self.a = {}
         self.hidden = {}
 
         self.V_history = []
         self.s1_action_history = []
+        self.s1_action_runs = []